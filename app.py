@@ -7,18 +7,37 @@ Monitora labels dos serviços e cria registros DNS automaticamente
 import json
 import logging
 import os
-from typing import Dict
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Set
+
+from cachetools import TTLCache
 
 from docker_manager import DockerManager
 from cloudflare_manager import CloudflareManager
 
 # Configuração de logging
+# LOG_LEVEL aceita: DEBUG, INFO, WARNING, ERROR, CRITICAL (padrão: INFO)
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+log_level = (os.getenv('LOG_LEVEL') or 'INFO').strip().upper()
+
 logging.basicConfig(
-    level=logging.INFO,
+    level=log_level if log_level in LOG_LEVELS else logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
+if log_level not in LOG_LEVELS:
+    logger.warning(
+        "LOG_LEVEL inválido: %r. Usando INFO (valores aceitos: %s)",
+        os.getenv('LOG_LEVEL'), ', '.join(LOG_LEVELS)
+    )
+
+# Limites do cache de serviços processados
+PROCESSED_CACHE_SIZE = 10_000
+PROCESSED_CACHE_TTL = 24 * 3600
+
 class CloudflareDNSManager:
     def __init__(self, domain_config: Dict[str, Dict[str, str]]):
         """
@@ -26,7 +45,59 @@ class CloudflareDNSManager:
         """
         self.docker_manager = DockerManager()
         self.cloudflare_manager = CloudflareManager(domain_config)
-        self.processed_services = set()
+        # Pares serviço:hostname já processados, limitados em tamanho e tempo
+        self.processed_services: TTLCache = TTLCache(
+            maxsize=PROCESSED_CACHE_SIZE,
+            ttl=PROCESSED_CACHE_TTL
+        )
+        
+        # Processamento paralelo: as chamadas à Cloudflare são limitadas por I/O
+        self._pool = ThreadPoolExecutor(max_workers=int(os.getenv('WORKERS', '16')))
+        self._lock = threading.Lock()
+        self._hostname_released = threading.Condition(self._lock)
+        self._in_flight: Set[str] = set()
+    
+    def _claim(self, service_key: str, hostname: str) -> bool:
+        """
+        Reserva um hostname para processamento
+        
+        Aguarda enquanto o hostname estiver em andamento em outra thread, já
+        que serviços diferentes podem compartilhar o mesmo Host(). Retorna
+        False se o par serviço/hostname já foi processado.
+        """
+        with self._hostname_released:
+            while True:
+                if service_key in self.processed_services:
+                    return False
+                if hostname not in self._in_flight:
+                    self._in_flight.add(hostname)
+                    return True
+                self._hostname_released.wait()
+    
+    def _release(self, service_key: str, hostname: str, processed: bool) -> None:
+        """
+        Libera um hostname, marcando o par serviço/hostname como processado se necessário
+        """
+        with self._hostname_released:
+            self._in_flight.discard(hostname)
+            if processed:
+                self.processed_services[service_key] = True
+            self._hostname_released.notify_all()
+    
+    def _forget(self, service_name: str) -> None:
+        """
+        Remove do cache os pares processados de um serviço
+        """
+        prefix = f"{service_name}:"
+        with self._lock:
+            for service_key in [k for k in self.processed_services if k.startswith(prefix)]:
+                self.processed_services.pop(service_key, None)
+    
+    def submit_service(self, service, action: str) -> None:
+        """
+        Agenda o processamento de um serviço no pool de workers
+        """
+        self._pool.submit(self.process_service, service, action)
     
     def process_service(self, service, action: str) -> None:
         """
@@ -35,7 +106,8 @@ class CloudflareDNSManager:
         try:
             if action == 'remove':
                 # TODO: Implementar remoção de registros DNS
-                logger.info(f"Serviço removido: {service.name}")
+                self._forget(service.name)
+                logger.info("Serviço removido: %s", service.name)
                 return
             
             service_info = self.docker_manager.get_service_info(service)
@@ -47,58 +119,68 @@ class CloudflareDNSManager:
                 
                 # Verifica se já foi processado
                 service_key = f"{service_info['name']}:{hostname}"
-                if service_key in self.processed_services:
-                    continue
-                
-                # Obtém configuração do domínio
-                domain_config = self.cloudflare_manager.get_domain_config(hostname)
-                if not domain_config:
-                    logger.warning(f"Configuração não encontrada para domínio: {hostname}")
+                if not self._claim(service_key, hostname):
                     continue
                 
-                # Determina se deve usar proxy
-                proxied = True  # Padrão
-                for router_name, proxy_setting in service_info['proxied_settings'].items():
-                    if router_name in rule or router_name in service_info['name']:
-                        proxied = proxy_setting
-                        break
-                
-                # Verifica se o registro já existe
-                existing_record = self.cloudflare_manager.get_record(
-                    domain_config['zone_id'],
-                    domain_config['api_key'],
-                    hostname
-                )
-                
-                if existing_record:
-                    logger.info(f"Registro DNS já existe: {hostname}")
-                    self.processed_services.add(service_key)
-                    continue
-                
-                # Cria o registro DNS
-                swarm_ip = self.docker_manager.get_swarm_node_ip()
-                if swarm_ip != '0.0.0.0':
-                    success = self.cloudflare_manager.create_record(
-                        domain_config['zone_id'],
-                        domain_config['api_key'],
-                        hostname,
-                        swarm_ip,
-                        proxied
-                    )
-                    
-                    if success:
-                        self.processed_services.add(service_key)
-                else:
-                    logger.error("IP público do Swarm não configurado")
+                processed = False
+                try:
+                    processed = self._process_hostname(service_info, rule, hostname)
+                finally:
+                    self._release(service_key, hostname, processed)
                     
         except Exception as e:
-            logger.error(f"Erro ao processar serviço {service.name}: {e}")
+            logger.error("Erro ao processar serviço %s: %s", service.name, e)
+    
+    def _process_hostname(self, service_info: Dict, rule: str, hostname: str) -> bool:
+        """
+        Garante o registro DNS de um hostname
+        
+        Retorna True quando o registro existe ou foi criado.
+        """
+        # Obtém configuração do domínio
+        domain_config = self.cloudflare_manager.get_domain_config(hostname)
+        if not domain_config:
+            logger.warning("Configuração não encontrada para domínio: %s", hostname)
+            return False
+        
+        # Determina se deve usar proxy
+        proxied = True  # Padrão
+        for router_name, proxy_setting in service_info['proxied_settings'].items():
+            if router_name in rule or router_name in service_info['name']:
+                proxied = proxy_setting
+                break
+        
+        # Verifica se o registro já existe
+        existing_record = self.cloudflare_manager.get_record(
+            domain_config['zone_id'],
+            hostname
+        )
+        
+        if existing_record:
+            logger.info("Registro DNS já existe: %s", hostname)
+            return True
+        
+        # Cria o registro DNS
+        swarm_ip = self.docker_manager.get_swarm_node_ip()
+        if swarm_ip == '0.0.0.0':
+            logger.error("IP público do Swarm não configurado")
+            return False
+        
+        return self.cloudflare_manager.create_record(
+            domain_config['zone_id'],
+            hostname,
+            swarm_ip,
+            proxied
+        )
     
     def start(self) -> None:
         """
         Inicia o monitoramento de serviços
         """
-        self.docker_manager.monitor_services(self.process_service)
+        try:
+            self.docker_manager.monitor_services(self.submit_service)
+        finally:
+            self._pool.shutdown(wait=False, cancel_futures=True)
 
 def load_config_from_env() -> Dict[str, Dict[str, str]]:
     """
@@ -108,7 +190,7 @@ def load_config_from_env() -> Dict[str, Dict[str, str]]:
     try:
         return json.loads(config_str)
     except json.JSONDecodeError as e:
-        logger.error(f"Erro ao carregar configuração dos domínios: {e}")
+        logger.error("Erro ao carregar configuração dos domínios: %s", e)
         return {}
 
 def main():
@@ -125,12 +207,18 @@ def main():
     # Cria e inicia o gerenciador
     manager = CloudflareDNSManager(domain_config)
     
+    # SIGHUP recarrega o IP do Swarm sem reiniciar o serviço
+    signal.signal(
+        signal.SIGHUP,
+        lambda signum, frame: manager.docker_manager.refresh_swarm_node_ip()
+    )
+    
     try:
         manager.start()
     except KeyboardInterrupt:
         logger.info("Parando o monitoramento...")
     except Exception as e:
-        logger.error(f"Erro fatal: {e}")
+        logger.error("Erro fatal: %s", e)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,9 +1,31 @@
-import requests
+import httpx
+import orjson
 import logging
-from typing import Dict, Optional
+import threading
+import time
+from typing import Dict, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# Tempo (em segundos) que uma consulta de registro DNS permanece em cache
+RECORD_CACHE_TTL = 900
+
+# Intervalo (em segundos) para recarregar a lista completa de registros de uma zona
+ZONE_REFRESH_INTERVAL = 900
+ZONE_PAGE_SIZE = 1000
+
+# Após uma falha ao listar a zona, espera (em segundos) antes de tentar de novo;
+# enquanto isso as consultas usam a busca por nome
+ZONE_RETRY_INTERVAL = 60
+
+# Máximo de requisições simultâneas por zona, para respeitar o rate limit da API
+ZONE_CONCURRENCY = 4
+
+# Novas tentativas para respostas transitórias da API em consultas (GET)
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+RETRY_ATTEMPTS = 3
+RETRY_BACKOFF = 0.3
+
 class CloudflareManager:
     def __init__(self, domain_config: Dict[str, Dict[str, str]]):
         """
@@ -14,51 +36,210 @@ class CloudflareManager:
                           formato: {"dominio.com": {"zone_id": "xxx", "api_key": "yyy"}}
         """
         self.domain_config = domain_config
+        
+        # URL e cabeçalhos de cada zona, montados uma única vez: zone_id -> (url, headers)
+        self._zone_ctx: Dict[str, Tuple[str, Dict[str, str]]] = {
+            config['zone_id']: (
+                f"https://api.cloudflare.com/client/v4/zones/{config['zone_id']}/dns_records",
+                {"Authorization": f"Bearer {config['api_key']}"}
+            )
+            for config in domain_config.values()
+        }
+        self._domains = {
+            domain.lower().rstrip('.'): config
+            for domain, config in domain_config.items()
+        }
+        
+        # Cliente compartilhado: HTTP/2 multiplexa as requisições de todas as
+        # threads sobre a mesma conexão TCP/TLS com a API
+        self._client = httpx.Client(
+            headers={"Content-Type": "application/json"},
+            transport=httpx.HTTPTransport(
+                http2=True,
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+                retries=RETRY_ATTEMPTS
+            )
+        )
+        
+        # Cache de consultas: (zone_id, name) -> (instante, registro ou None)
+        self._record_cache: Dict[Tuple[str, str], Tuple[float, Optional[Dict]]] = {}
+        self._cache_lock = threading.Lock()
+        
+        # Registros A de cada zona: zone_id -> {nome: registro}
+        self._zone_records: Dict[str, Dict[str, Dict]] = {}
+        self._zone_loaded: Dict[str, float] = {}
+        self._zone_failed: Dict[str, float] = {}
+        self._zone_locks: Dict[str, threading.Lock] = {}
+        
+        self._zone_limits: Dict[str, threading.Semaphore] = {
+            config['zone_id']: threading.Semaphore(ZONE_CONCURRENCY)
+            for config in domain_config.values()
+        }
+    
+    def _zone_limit(self, zone_id: str) -> threading.Semaphore:
+        """
+        Obtém o semáforo que limita a concorrência de uma zona
+        """
+        return self._zone_limits.setdefault(zone_id, threading.Semaphore(ZONE_CONCURRENCY))
+    
+    def _get(self, url: str, headers: Dict[str, str], params: Dict) -> httpx.Response:
+        """
+        Executa um GET, repetindo a requisição em respostas transitórias (429/5xx)
+        """
+        response = self._client.get(url, headers=headers, params=params)
+        for attempt in range(RETRY_ATTEMPTS):
+            if response.status_code not in RETRY_STATUSES:
+                break
+            time.sleep(RETRY_BACKOFF * 2 ** attempt)
+            response = self._client.get(url, headers=headers, params=params)
+        return response
+    
+    def _cache_record(self, zone_id: str, name: str, record: Optional[Dict]) -> None:
+        """
+        Armazena o resultado de uma consulta no cache de registros
+        """
+        with self._cache_lock:
+            self._record_cache[(zone_id, name)] = (time.monotonic(), record)
+            if record is not None and zone_id in self._zone_records:
+                self._zone_records[zone_id][name.lower()] = record
+    
+    def prime_zone(self, zone_id: str) -> bool:
+        """
+        Carrega em memória todos os registros A de uma zona
+        
+        Retorna True se a lista completa foi obtida. Em caso de falha, novas
+        tentativas automáticas aguardam ZONE_RETRY_INTERVAL segundos.
+        """
+        url, headers = self._zone_ctx[zone_id]
+        
+        started = time.monotonic()
+        records = {}
+        page = 1
+        try:
+            while True:
+                params = {"type": "A", "per_page": ZONE_PAGE_SIZE, "page": page}
+                with self._zone_limit(zone_id):
+                    response = self._get(url, headers, params)
+                response.raise_for_status()
+                data = orjson.loads(response.content)
+                
+                if not data["success"]:
+                    logger.error("Erro ao listar registros DNS da zona %s: %s", zone_id, data.get('errors', []))
+                    self._zone_failed[zone_id] = time.monotonic()
+                    return False
+                
+                for record in data["result"]:
+                    records[record["name"].lower()] = record
+                
+                total_pages = (data.get("result_info") or {}).get("total_pages", 1)
+                if page >= total_pages:
+                    break
+                page += 1
+                
+        except (httpx.HTTPError, orjson.JSONDecodeError) as e:
+            logger.error("Erro ao listar registros DNS da zona %s: %s", zone_id, e)
+            self._zone_failed[zone_id] = time.monotonic()
+            return False
+        
+        with self._cache_lock:
+            # Registros criados ou encontrados enquanto a listagem estava em
+            # andamento podem não constar nela
+            for (cached_zone, name), (cached_at, record) in self._record_cache.items():
+                if cached_zone == zone_id and record is not None and cached_at >= started:
+                    records[name.lower()] = record
+            
+            self._zone_records[zone_id] = records
+            self._zone_loaded[zone_id] = time.monotonic()
+            self._zone_failed.pop(zone_id, None)
+        
+        logger.info("%s registros DNS carregados da zona %s", len(records), zone_id)
+        return True
+    
+    def _zone_state(self, zone_id: str) -> Tuple[bool, bool]:
+        """
+        Indica se a lista da zona está atualizada e se uma falha recente impede recarregá-la
+        """
+        now = time.monotonic()
+        loaded = self._zone_loaded.get(zone_id)
+        failed = self._zone_failed.get(zone_id)
+        fresh = loaded is not None and now - loaded < ZONE_REFRESH_INTERVAL
+        backing_off = failed is not None and now - failed < ZONE_RETRY_INTERVAL
+        return fresh, backing_off
+    
+    def _zone_snapshot(self, zone_id: str) -> Optional[Dict[str, Dict]]:
+        """
+        Obtém os registros da zona em memória, recarregando-os quando expirados
+        
+        Retorna None se a lista não está disponível, para que a consulta por
+        nome seja usada.
+        """
+        fresh, backing_off = self._zone_state(zone_id)
+        if not fresh and not backing_off:
+            with self._zone_locks.setdefault(zone_id, threading.Lock()):
+                # Outra thread pode ter recarregado a zona enquanto esta aguardava
+                fresh, backing_off = self._zone_state(zone_id)
+                if not fresh and not backing_off:
+                    fresh = self.prime_zone(zone_id)
+        
+        return self._zone_records.get(zone_id) if fresh else None
     
     def get_domain_config(self, hostname: str) -> Optional[Dict[str, str]]:
         """
         Obtém a configuração do domínio baseado no hostname
+        
+        Percorre os sufixos do hostname do mais longo para o mais curto,
+        de forma que o domínio mais específico configurado prevaleça.
         """
-        for domain, config in self.domain_config.items():
-            if hostname.endswith(domain):
+        suffix = hostname.lower().rstrip('.')
+        while suffix:
+            config = self._domains.get(suffix)
+            if config is not None:
                 return config
+            suffix = suffix.partition('.')[2]
         return None
     
-    def get_record(self, zone_id: str, api_key: str, name: str) -> Optional[Dict]:
+    def get_record(self, zone_id: str, name: str) -> Optional[Dict]:
         """
         Verifica se um registro DNS já existe na Cloudflare
+        
+        Consulta primeiro a lista de registros da zona em memória e só faz
+        uma busca por nome se a zona não pôde ser carregada.
         """
-        url = f"https://api.cloudflare.com/client/v4/zones/{zone_id}/dns_records"
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
+        records = self._zone_snapshot(zone_id)
+        if records is not None:
+            return records.get(name.lower())
+        
+        cached = self._record_cache.get((zone_id, name))
+        if cached and time.monotonic() - cached[0] < RECORD_CACHE_TTL:
+            return cached[1]
+        
+        url, headers = self._zone_ctx[zone_id]
         
         params = {"name": name, "type": "A"}
         
         try:
-            response = requests.get(url, headers=headers, params=params)
+            with self._zone_limit(zone_id):
+                response = self._get(url, headers, params)
             response.raise_for_status()
-            data = response.json()
+            data = orjson.loads(response.content)
             
-            if data["success"] and data["result"]:
-                return data["result"][0]
-            return None
+            if not data["success"]:
+                return None
+            
+            record = data["result"][0] if data["result"] else None
+            self._cache_record(zone_id, name, record)
+            return record
             
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Erro ao verificar registro DNS para {name}: {e}")
+        except (httpx.HTTPError, orjson.JSONDecodeError) as e:
+            logger.error("Erro ao verificar registro DNS para %s: %s", name, e)
             return None
     
-    def create_record(self, zone_id: str, api_key: str, name: str, 
+    def create_record(self, zone_id: str, name: str, 
                      ip: str, proxied: bool = True) -> bool:
         """
         Cria um registro DNS na Cloudflare
         """
-        url = f"https://api.cloudflare.com/client/v4/zones/{zone_id}/dns_records"
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
+        url, headers = self._zone_ctx[zone_id]
         
         data = {
             "type": "A",
@@ -69,17 +250,19 @@ class CloudflareManager:
         }
         
         try:
-            response = requests.post(url, headers=headers, json=data)
+            with self._zone_limit(zone_id):
+                response = self._client.post(url, headers=headers, content=orjson.dumps(data))
             response.raise_for_status()
-            result = response.json()
+            result = orjson.loads(response.content)
             
             if result["success"]:
-                logger.info(f"Registro DNS criado: {name} -> {ip} (proxied: {proxied})")
+                self._cache_record(zone_id, name, result["result"])
+                logger.info("Registro DNS criado: %s -> %s (proxied: %s)", name, ip, proxied)
                 return True
             else:
-                logger.error(f"Erro ao criar registro DNS: {result.get('errors', [])}")
+                logger.error("Erro ao criar registro DNS: %s", result.get('errors', []))
                 return False
                 
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Erro ao criar registro DNS para {name}: {e}")
+        except (httpx.HTTPError, orjson.JSONDecodeError) as e:
+            logger.error("Erro ao criar registro DNS para %s: %s", name, e)
             return False 
\ No newline at end of file
@@ -1,29 +1,87 @@
-import docker
+import functools
 import logging
 import os
-import re
-from typing import Dict, List, Optional, Set
+import queue
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, Optional, Set, Tuple
+
+if TYPE_CHECKING:
+    import docker
 
 logger = logging.getLogger(__name__)
 
+# Delimitadores de Host(`hostname`) e da forma alternativa Host("hostname")
+_HOST_DELIMITERS = (('Host(`', '`'), ('Host("', '"'))
+
+# Sufixos das labels do Traefik relevantes para o DNS
+_RULE_SUFFIX = '.rule'
+_PROXIED_SUFFIX = '.cloudflare.proxied'
+
+@functools.lru_cache(maxsize=4096)
+def _router_name(key: str) -> str:
+    """
+    Extrai o nome do router de uma label '<...>.<router>.cloudflare.proxied'
+    """
+    return key[:-len(_PROXIED_SUFFIX)].rpartition('.')[2]
+
+# Ações de eventos de serviço que afetam os registros DNS
+SERVICE_ACTIONS = ('create', 'update', 'remove')
+
+# Janela (em segundos) para agrupar eventos em uma única consulta de serviços
+EVENT_BATCH_WINDOW = 0.1
+
+# Espera (em segundos) antes de reconectar ao stream de eventos
+EVENT_RECONNECT_DELAY = 1
+
+# Tempo (em segundos) sem eventos após o qual os serviços são sincronizados
+EVENT_HEARTBEAT = 300
+
+def _docker_timestamp(timestamp_ns: int) -> str:
+    """
+    Formata um timestamp em nanossegundos como '<segundos>.<nanossegundos>' para a API do Docker
+    """
+    seconds, nanos = divmod(timestamp_ns, 10**9)
+    return f"{seconds}.{nanos:09d}"
+
 class DockerManager:
     def __init__(self):
         """
         Inicializa o gerenciador do Docker
         """
-        self.docker_client = docker.from_env()
+        # Importado aqui para que o SDK do Docker só seja carregado quando usado
+        import docker
+        
+        self.docker_client: 'docker.DockerClient' = docker.from_env()
         self.processed_services: Set[str] = set()
+        self._swarm_ip = self._resolve_swarm_ip()
+        
+        # Informações já extraídas por serviço: ID -> (versão da spec, informações)
+        self._service_info: Dict[str, Tuple[int, Dict]] = {}
     
     def get_swarm_node_ip(self) -> str:
         """
-        Obtém o IP do nó do Swarm
+        Obtém o IP do nó do Swarm (resolvido na inicialização)
+        """
+        return self._swarm_ip
+    
+    def refresh_swarm_node_ip(self) -> None:
+        """
+        Resolve novamente o IP do nó do Swarm
+        """
+        self._swarm_ip = self._resolve_swarm_ip()
+        logger.info("IP do Swarm atualizado: %s", self._swarm_ip)
+    
+    def _resolve_swarm_ip(self) -> str:
+        """
+        Consulta o Docker para determinar o IP do nó do Swarm
         """
         try:
             swarm_info = self.docker_client.info()
             if 'Swarm' in swarm_info and swarm_info['Swarm']['LocalNodeState'] == 'active':
                 return os.getenv('SWARM_PUBLIC_IP', '0.0.0.0')
         except Exception as e:
-            logger.warning(f"Erro ao obter IP do Swarm: {e}")
+            logger.warning("Erro ao obter IP do Swarm: %s", e)
         
         return os.getenv('PUBLIC_IP', '0.0.0.0')
     
@@ -31,77 +89,227 @@ class DockerManager:
         """
         Extrai o hostname da regra do Traefik
         """
-        # Padrão para Host(`hostname`)
-        host_pattern = r'Host\(`([^`]+)`\)'
-        match = re.search(host_pattern, rule)
-        
-        if match:
-            return match.group(1)
-        
-        # Padrão alternativo: Host("hostname")
-        host_pattern_alt = r'Host\("([^"]+)"\)'
-        match = re.search(host_pattern_alt, rule)
-        
-        if match:
-            return match.group(1)
-            
+        for opening, quote in _HOST_DELIMITERS:
+            index = rule.find(opening)
+            while index != -1:
+                start = index + len(opening)
+                end = rule.find(quote, start)
+                if end == -1:
+                    break
+                if end > start and rule.startswith(')', end + 1):
+                    return rule[start:end]
+                index = rule.find(opening, index + 1)
         return None
     
     def get_service_info(self, service) -> Dict:
         """
         Extrai informações relevantes de um serviço
+        
+        O resultado é reaproveitado enquanto a versão da spec do serviço não muda.
         """
-        service_name = service.name
+        service_id = service.id
+        version = service.attrs.get('Version', {}).get('Index')
+        cached = self._service_info.get(service_id)
+        if cached and version is not None and cached[0] == version:
+            return cached[1]
+        
         labels = service.attrs.get('Spec', {}).get('Labels', {})
         
-        traefik_rules = []
-        proxied_settings = {}
+        traefik_rules = [
+            labels[key] for key in labels
+            if key.endswith(_RULE_SUFFIX) and 'Host(' in labels[key]
+        ]
         
-        for key, value in labels.items():
-            if '.rule' in key and 'Host(' in value:
-                traefik_rules.append(value)
-            
-            if key.endswith('.cloudflare.proxied'):
-                router_name = key.split('.cloudflare.proxied')[0].split('.')[-1]
-                proxied_settings[router_name] = value.lower() == 'true'
+        # Configurações de proxy só importam para serviços com regras Host()
+        proxied_settings = {}
+        if traefik_rules:
+            for key, value in labels.items():
+                if key.endswith(_PROXIED_SUFFIX):
+                    proxied_settings[_router_name(key)] = value.lower() == 'true'
         
-        return {
-            'name': service_name,
+        service_info = {
+            'name': service.name,
             'rules': traefik_rules,
             'proxied_settings': proxied_settings
         }
+        
+        if version is not None:
+            self._service_info[service_id] = (version, service_info)
+        return service_info
+    
+    def forget_service(self, service_id: str) -> None:
+        """
+        Descarta as informações em cache de um serviço removido
+        """
+        self._service_info.pop(service_id, None)
+    
+    def _removed_service(self, service_id: str, name: str):
+        """
+        Monta um modelo mínimo para um serviço removido
+        
+        Serviços removidos não existem mais na API, então apenas o ID e o
+        nome conhecidos são preenchidos.
+        """
+        return self.docker_client.services.prepare_model(
+            {'ID': service_id, 'Spec': {'Name': name}}
+        )
+    
+    def _read_events(self, events: queue.Queue, since_ns: int) -> None:
+        """
+        Lê o stream de eventos do Docker e enfileira os eventos relevantes
+        
+        Se o stream for encerrado ou falhar (ex.: reinício do daemon), reconecta
+        logo após o último evento recebido para que nenhum evento seja perdido
+        nem repetido.
+        
+        Args:
+            events: Fila onde os eventos são colocados
+            since_ns: Timestamp (em nanossegundos) a partir do qual os eventos são lidos
+        """
+        while True:
+            try:
+                for event in self.docker_client.events(
+                    since=_docker_timestamp(since_ns),
+                    filters={'type': 'service', 'scope': 'swarm'},
+                    decode=True
+                ):
+                    # O filtro 'since' do Docker é inclusivo: avança 1ns além do último evento
+                    event_ns = event.get('timeNano') or event.get('time', 0) * 10**9
+                    since_ns = event_ns + 1
+                    if event.get('Type') == 'service' and event.get('Action') in SERVICE_ACTIONS:
+                        events.put(event)
+                
+                logger.warning("Stream de eventos do Docker encerrado, reconectando...")
+            except Exception as e:
+                logger.warning("Erro no stream de eventos do Docker, reconectando: %s", e)
+            
+            time.sleep(EVENT_RECONNECT_DELAY)
+    
+    def _resync_services(self, callback) -> None:
+        """
+        Compara a lista atual de serviços com os conhecidos e despacha as diferenças
+        
+        Rede de segurança para eventos perdidos: serviços sem alteração de
+        versão são descartados rapidamente por get_service_info.
+        """
+        logger.info("Nenhum evento recebido recentemente, sincronizando serviços...")
+        
+        try:
+            services = self.docker_client.services.list()
+        except Exception as e:
+            logger.error("Erro ao sincronizar serviços: %s", e)
+            return
+        
+        current = {service.id for service in services}
+        for service_id, (_, service_info) in list(self._service_info.items()):
+            if service_id in current:
+                continue
+            
+            self.forget_service(service_id)
+            try:
+                callback(self._removed_service(service_id, service_info['name']), 'remove')
+            except Exception as e:
+                logger.error("Erro ao processar evento: %s", e)
+        
+        for service in services:
+            try:
+                callback(service, 'update')
+            except Exception as e:
+                logger.error("Erro ao processar evento: %s", e)
+    
+    def _dispatch_events(self, pending: Dict[str, Dict], callback) -> None:
+        """
+        Despacha um lote de eventos, buscando os serviços alterados em uma única chamada
+        
+        Args:
+            pending: Último evento recebido para cada ID de serviço
+            callback: Função chamada para cada serviço
+        """
+        changed = {}
+        for service_id, event in pending.items():
+            if event['Action'] != 'remove':
+                changed[service_id] = event['Action']
+                continue
+            
+            self.forget_service(service_id)
+            name = event['Actor'].get('Attributes', {}).get('name', service_id)
+            try:
+                callback(self._removed_service(service_id, name), 'remove')
+            except Exception as e:
+                logger.error("Erro ao processar evento: %s", e)
+        
+        if not changed:
+            return
+        
+        try:
+            services = self.docker_client.services.list(filters={'id': list(changed)})
+        except Exception as e:
+            logger.error("Erro ao obter serviços do lote de eventos: %s", e)
+            return
+        
+        for service in services:
+            action = changed.get(service.id)
+            if not action:
+                continue
+            
+            try:
+                callback(service, action)
+            except Exception as e:
+                logger.error("Erro ao processar evento: %s", e)
     
     def monitor_services(self, callback) -> None:
         """
         Monitora eventos do Docker Swarm em tempo real
         
+        Eventos recebidos dentro de EVENT_BATCH_WINDOW segundos são agrupados,
+        de forma que uma rajada (ex.: deploy de uma stack) gere uma única
+        consulta à API do Docker.
+        
         Args:
             callback: Função chamada quando um serviço é criado/atualizado/removido
         """
         logger.info("Iniciando monitoramento de eventos do Docker...")
         
         try:
+            # Eventos ocorridos durante a listagem inicial também são lidos
+            since_ns = time.time_ns()
+            
             # Processa serviços existentes primeiro
             services = self.docker_client.services.list()
             for service in services:
                 callback(service, 'create')
             
-            # Escuta eventos de serviços
-            for event in self.docker_client.events(
-                filters={'type': 'service'},
-                decode=True
-            ):
+            # Escuta eventos de serviços em uma thread separada
+            events: queue.Queue = queue.Queue()
+            threading.Thread(
+                target=self._read_events,
+                args=(events, since_ns),
+                name='docker-events',
+                daemon=True
+            ).start()
+            
+            while True:
                 try:
-                    if event['Type'] == 'service':
-                        service_id = event['Actor']['ID']
-                        service = self.docker_client.services.get(service_id)
-                        
-                        if event['Action'] in ['create', 'update', 'remove']:
-                            callback(service, event['Action'])
-                            
-                except Exception as e:
-                    logger.error(f"Erro ao processar evento: {e}")
+                    event = events.get(timeout=EVENT_HEARTBEAT)
+                except queue.Empty:
+                    self._resync_services(callback)
+                    continue
+                
+                pending: Dict[str, Dict] = {}
+                deadline = time.monotonic() + EVENT_BATCH_WINDOW
+                
+                while True:
+                    pending[event['Actor']['ID']] = event
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        event = events.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                
+                self._dispatch_events(pending, callback)
                     
         except Exception as e:
-            logger.error(f"Erro fatal no monitoramento: {e}")
-            raise 
\ No newline at end of file
+            logger.error("Erro fatal no monitoramento: %s", e)
+            raise